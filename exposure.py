@@ -0,0 +1,236 @@
+"""Flood exposure helpers: fast sampling of assets against the flood raster."""
+import hashlib
+from functools import lru_cache
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+import streamlit as st
+from pyproj import CRS, Transformer
+from rasterio import features
+from shapely.geometry import shape
+
+try:
+    from numba import njit, prange
+except Exception:
+    njit = None
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True, fastmath=True)
+    def _count_flood_numba(flood):
+        n = 0
+        for i in prange(flood.shape[0]):
+            row = 0
+            for j in range(flood.shape[1]):
+                row += 1 if flood[i, j] == 1 else 0
+            n += row
+        return n
+
+
+@lru_cache(maxsize=8)
+def get_transformer(src_crs: str, dst_crs: str) -> Transformer:
+    """Reused pyproj Transformer for a (source, destination) CRS pair.
+
+    Construction parses the CRS and builds a PROJ pipeline — far more
+    expensive than the batched transform calls it serves, so build each pair
+    (given as WKT or an authority string like "EPSG:4326") exactly once.
+    """
+    return Transformer.from_crs(
+        CRS.from_user_input(src_crs), CRS.from_user_input(dst_crs), always_xy=True
+    )
+
+
+def count_flooded_pixels(flood) -> int:
+    """Count flooded pixels in one fused pass.
+
+    np.sum(flood==1) materializes a DEM-sized boolean temporary on every call;
+    the Numba kernel (when available) fuses the compare and reduction, and the
+    fallback sums the 0/1 mask directly.
+    """
+    if njit is not None:
+        return int(_count_flood_numba(flood))
+    return int(flood.sum(dtype=np.int64))
+
+
+@st.cache_data(
+    show_spinner=False,
+    hash_funcs={gpd.GeoDataFrame: lambda g: (len(g), g.total_bounds.tobytes())},
+)
+def project_roads(roads_gdf: gpd.GeoDataFrame, crs_wkt: str) -> gpd.GeoDataFrame:
+    """Reproject the road network once per (roads, CRS) pair.
+
+    to_crs over thousands of LineStrings dominates flooded-road timing, so it
+    must not rerun on every slider drag.
+    """
+    return roads_gdf.to_crs(crs_wkt)
+
+
+def _flooded_length_per_geom(coords, geom_idx, flood_mask, transform):
+    """Flooded length (CRS units) per geometry for a packed coordinate array.
+
+    Steps along every segment at roughly pixel resolution, gathers the flood
+    mask at each step, and scales each segment's length by its flooded-step
+    fraction, then folds segments back onto their parent geometries. All
+    array math — no GEOS involved.
+    """
+    n_geoms = int(geom_idx[-1]) + 1 if geom_idx.size else 0
+    px_w, px_h = abs(transform.a), abs(transform.e)
+    starts, ends = coords[:-1], coords[1:]
+    same = geom_idx[:-1] == geom_idx[1:]
+    starts, ends, seg_geom = starts[same], ends[same], geom_idx[:-1][same]
+    if starts.shape[0] == 0:
+        return np.zeros(n_geoms, dtype=np.float64)
+
+    d = ends - starts
+    seg_len = np.hypot(d[:, 0], d[:, 1])
+    n = np.maximum(np.ceil(np.hypot(d[:, 0] / px_w, d[:, 1] / px_h)).astype(np.int64), 1)
+
+    # Mid-step sample positions for every segment, flattened: fraction along
+    # segment i is (k + 0.5) / n[i] for k in range(n[i]).
+    reps = np.repeat(np.arange(starts.shape[0]), n)
+    k = np.arange(reps.size) - np.repeat(np.cumsum(n) - n, n)
+    frac = (k + 0.5) / n[reps]
+    xs = starts[reps, 0] + d[reps, 0] * frac
+    ys = starts[reps, 1] + d[reps, 1] * frac
+
+    # ~transform handles rotated affines too, and broadcasts over arrays.
+    fcols, frows = ~transform * (xs, ys)
+    cols = np.floor(fcols).astype(np.intp)
+    rows = np.floor(frows).astype(np.intp)
+    valid = (rows >= 0) & (rows < flood_mask.shape[0]) & (cols >= 0) & (cols < flood_mask.shape[1])
+    hit = np.zeros(reps.size, dtype=np.float64)
+    hit[valid] = flood_mask[rows[valid], cols[valid]] > 0
+
+    flooded_steps = np.bincount(reps, weights=hit, minlength=n.size)
+    return np.bincount(seg_geom, weights=seg_len * flooded_steps / n, minlength=n_geoms)
+
+
+def _sample_along_segments(coords, geom_idx, flood_mask, transform):
+    """Total flooded length (CRS units) across all segments."""
+    return float(_flooded_length_per_geom(coords, geom_idx, flood_mask, transform).sum())
+
+
+def calculate_flooded_roads_km(roads_gdf, flood_mask, dem_transform, dem_crs):
+    """Calculates the approximate length of flooded roads.
+
+    Works directly in raster space: each road is densified to pixel-sized
+    steps and sampled against the flood mask, replacing the old
+    raster→polygon→GEOS-intersection chain.
+    """
+    if roads_gdf.empty:
+        return 0.0
+
+    roads_proj = project_roads(roads_gdf, dem_crs.to_wkt())
+    coords, geom_idx = shapely.get_coordinates(roads_proj.geometry.values, return_index=True)
+    if coords.shape[0] < 2:
+        return 0.0
+
+    # Length is in meters, convert to km
+    return _sample_along_segments(coords, geom_idx, flood_mask, dem_transform) / 1000.0
+
+
+def flooded_roads_km_by_type(roads_gdf, flood_mask, dem_transform, dem_crs) -> dict:
+    """Flooded road length (km) broken down by OSM highway class.
+
+    One linear pass: per-geometry flooded lengths come out of the raster
+    sampler, and a single groupby folds them onto the highway tag — no
+    repeated boolean masking per class.
+    """
+    if roads_gdf.empty or "highway" not in roads_gdf.columns:
+        return {}
+
+    roads_proj = project_roads(roads_gdf, dem_crs.to_wkt())
+    coords, geom_idx = shapely.get_coordinates(roads_proj.geometry.values, return_index=True)
+    if coords.shape[0] < 2:
+        return {}
+
+    per_geom_km = _flooded_length_per_geom(coords, geom_idx, flood_mask, dem_transform) / 1000.0
+    by_type = pd.Series(per_geom_km).groupby(roads_gdf["highway"].values, sort=False).sum()
+    by_type = by_type.loc[lambda s: s.index.notna() & (s.index != "unknown") & (s > 0)]
+    return by_type.to_dict()
+
+
+def flood_fingerprint(flood_mask) -> str:
+    """Cheap content hash of the flood mask for cache keying."""
+    return hashlib.blake2b(flood_mask.tobytes(), digest_size=8).hexdigest()
+
+
+@st.cache_resource(show_spinner=False)
+def cached_flood_polygons(fingerprint: str, _flood_mask, _transform):
+    """Polygonize once per distinct mask; reruns hash only the fingerprint.
+
+    The mask and transform are underscore-prefixed so Streamlit's hasher never
+    walks the DEM-sized array — the blake2b fingerprint is the whole key.
+    """
+    return build_flood_polygons(_flood_mask, _transform)
+
+
+def build_flood_polygons(flood_mask, transform):
+    """Polygonize the flood mask, returning the raw (undissolved) polygon list.
+
+    Deliberately no unary_union: dissolving thousands of pixel polygons into
+    one massive MultiPolygon makes every later intersection re-traverse it.
+    """
+    shapes = features.shapes(flood_mask, mask=flood_mask.astype(bool, copy=False), transform=transform)
+    return [shape(geom) for geom, val in shapes if val == 1]
+
+
+def flooded_roads_km_vector(roads_gdf, flood_mask, dem_transform, dem_crs):
+    """GEOS-based flooded-road length; slower cross-check for the raster sampler.
+
+    STRtree pairs each road only with the undissolved mask polygons it
+    actually touches, so the intersection work is O(hits) and the pixel
+    polygons stay small. Pieces from adjacent pixel polygons are disjoint, so
+    summing their lengths does not double count.
+    """
+    if roads_gdf.empty:
+        return 0.0
+
+    roads_proj = project_roads(roads_gdf, dem_crs.to_wkt())
+    flood_polys = cached_flood_polygons(flood_fingerprint(flood_mask), flood_mask, dem_transform)
+    if not flood_polys:
+        return 0.0
+
+    geoms = roads_proj.geometry.values
+    tree = shapely.STRtree(flood_polys)
+    pairs = tree.query(geoms, predicate="intersects")
+    if pairs.size == 0:
+        return 0.0
+    road_i, poly_i = pairs
+    inter = shapely.intersection(geoms[road_i], np.asarray(flood_polys, dtype=object)[poly_i])
+    return float(shapely.length(inter).sum()) / 1000.0
+
+
+def calculate_point_exposure(points_gdf, flood_mask, transform, transformer) -> int:
+    """Count point assets (health sites, shelters) sitting on flooded pixels.
+
+    Pure raster-space test: no polygonization or GEOS point-in-polygon — the
+    mask already answers the question with one batched gather.
+    """
+    if points_gdf.empty:
+        return 0
+    return sample_mask_vec(flood_mask, points_gdf["lon"], points_gdf["lat"], transform, transformer)
+
+
+def sample_mask_vec(mask, lons, lats, transform, transformer):
+    """Count how many lon/lat points fall on flooded pixels.
+
+    One batched pyproj transform plus NumPy index arithmetic replaces the
+    per-point Python loop: the transform releases the GIL and the raster
+    lookup is a single fancy-index gather.
+    """
+    lons = np.asarray(lons, dtype="float64")
+    lats = np.asarray(lats, dtype="float64")
+    if lons.size == 0:
+        return 0
+
+    xs, ys = transformer.transform(lons, lats)
+    fcols, frows = ~transform * (np.asarray(xs), np.asarray(ys))
+    cols = np.floor(fcols).astype(np.intp)
+    rows = np.floor(frows).astype(np.intp)
+    valid = (rows >= 0) & (rows < mask.shape[0]) & (cols >= 0) & (cols < mask.shape[1])
+    if not valid.any():
+        return 0
+    return int((mask[rows[valid], cols[valid]] > 0).sum())
@@ -0,0 +1,438 @@
+"""Forecast feeds, summaries, and water-level guidance for JolChobi.
+
+Network I/O (Open-Meteo, Open-Meteo Flood, OpenAI) goes through one pooled
+session; the summarizers reduce the raw JSON with float32 array math and only
+build DataFrames for the chart/table views.
+"""
+import hashlib
+import json
+import textwrap
+from datetime import datetime
+
+import numpy as np
+import orjson
+import pandas as pd
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from requests_cache import CachedSession
+except Exception:
+    CachedSession = None
+
+
+def create_retry_session(cache_name: str | None = None) -> requests.Session:
+    """Shared HTTP session: keep-alive pooling + light retries for flaky feeds.
+
+    With ``cache_name`` (and requests-cache installed) the session also keeps
+    a SQLite response cache keyed on the full request, POST bodies included.
+    st.cache_data stays the fast in-process tier; this one survives process
+    restarts, so a warm start answers repeat Overpass queries from disk
+    instead of a multi-second, rate-limited round-trip.
+    """
+    if cache_name is not None and CachedSession is not None:
+        session = CachedSession(
+            cache_name, backend="sqlite", expire_after=3600,
+            allowable_methods=("GET", "POST"),
+        )
+    else:
+        session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_SESSION = create_retry_session()
+
+# The OpenAI session is built lazily: most sessions never request LLM
+# guidance, and a dedicated pool keeps the kept-alive TLS connection to
+# api.openai.com out of the feed pool's way.
+_LLM_SESSION = None
+
+
+def _llm_session() -> requests.Session:
+    global _LLM_SESSION
+    if _LLM_SESSION is None:
+        _LLM_SESSION = create_retry_session()
+    return _LLM_SESSION
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def fetch_weekly_forecast(lat: float, lon: float) -> dict:
+    """Fetch 7-day forecast from the Open-Meteo API."""
+    url = "https://api.open-meteo.com/v1/forecast"
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "daily": ",".join([
+            "precipitation_sum",
+            "windspeed_10m_max",
+            "temperature_2m_max"
+        ]),
+        "timezone": "UTC",
+        "forecast_days": 7
+    }
+    response = _SESSION.get(url, params=params, timeout=20)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+@st.cache_data(show_spinner=False, ttl=1800)
+def fetch_hourly_precipitation(lat: float, lon: float) -> dict:
+    """Retrieve the last 48h + next 72h hourly precipitation totals."""
+    url = "https://api.open-meteo.com/v1/forecast"
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "hourly": "precipitation,rain",
+        "past_days": 2,
+        "forecast_days": 3,
+        "timezone": "UTC"
+    }
+    response = _SESSION.get(url, params=params, timeout=20)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def fetch_hydrology_forecast(lat: float, lon: float) -> dict:
+    """Pull daily river discharge projections from the Open-Meteo Flood API."""
+    url = "https://flood-api.open-meteo.com/v1/flood"
+    params = {
+        "latitude": lat,
+        "longitude": lon,
+        "daily": "river_discharge,river_discharge_min,river_discharge_max,river_discharge_mean",
+        "past_days": 3,
+        "forecast_days": 10,
+        "timezone": "UTC"
+    }
+    response = _SESSION.get(url, params=params, timeout=20)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+
+def _json_digest(d: dict) -> str:
+    """Stable content hash so st.cache_data can key on raw feed payloads."""
+    return hashlib.blake2b(
+        orjson.dumps(d, option=orjson.OPT_SORT_KEYS, default=str), digest_size=16
+    ).hexdigest()
+
+
+# Summaries rerun on every script pass even when the cached JSON payload is
+# identical; content-hashing the dict argument makes them memoized too. The
+# ttl keeps time-relative windows (e.g. "last 48h") from going stale.
+_SUMMARY_CACHE = dict(ttl=1800, show_spinner=False, hash_funcs={dict: _json_digest})
+
+
+def _as_float32(values) -> np.ndarray:
+    """Convert a JSON-origin list (possibly holding nulls) to a float32 array."""
+    return np.fromiter(
+        (np.nan if v is None else v for v in values), dtype=np.float32, count=len(values)
+    )
+
+
+@st.cache_data(**_SUMMARY_CACHE)
+def summarize_forecast(forecast: dict) -> dict:
+    daily = forecast.get("daily", {})
+    dates = daily.get("time", [])
+    rain = daily.get("precipitation_sum", [])
+    wind = daily.get("windspeed_10m_max", [])
+    temp = daily.get("temperature_2m_max", [])
+    if not dates:
+        raise ValueError("Forecast did not include daily outlook data")
+
+    # Reduce on plain float32 arrays; only build the DataFrame once at the end
+    # for the tabular view the UI renders.
+    rain_vals = _as_float32(rain)
+    wind_vals = _as_float32(wind)
+    temp_vals = _as_float32(temp)
+
+    total_rain = float(np.nansum(rain_vals)) if np.isfinite(rain_vals).any() else 0.0
+    peak_wind = float(np.nanmax(wind_vals)) if np.isfinite(wind_vals).any() else 0.0
+    mean_temp = float(np.nanmean(temp_vals)) if np.isfinite(temp_vals).any() else 0.0
+
+    df = pd.DataFrame(
+        {
+            "Date": pd.to_datetime(dates).strftime("%a %d %b"),
+            "Rain (mm)": rain_vals,
+            "Wind max (km/h)": wind_vals,
+            "Temp max (°C)": temp_vals
+        }
+    )
+
+    suggested_extra = float(np.clip(total_rain / 200.0 + peak_wind / 150.0, 0.0, 6.0))
+
+    return {
+        "scalars": {
+            "total_rain": total_rain,
+            "peak_wind": peak_wind,
+            "mean_temp": mean_temp,
+            "suggested_extra": round(suggested_extra, 2),
+            "issued_at": datetime.utcnow(),
+        },
+        "dataframe": df,
+    }
+
+
+@st.cache_data(**_SUMMARY_CACHE)
+def summarize_precip(hourly: dict) -> dict:
+    data = hourly.get("hourly", {})
+    times = pd.to_datetime(data.get("time", []))
+    if times.empty:
+        raise ValueError("Hourly precipitation feed returned no timestamps")
+    precip_vals = _as_float32(data.get("precipitation", []))
+
+    # The feed is time-sorted, so the three windows are just slice boundaries:
+    # searchsorted finds them in O(log n) instead of three full boolean scans.
+    ts = times.values
+    now = np.datetime64(datetime.utcnow())
+    i_recent = np.searchsorted(ts, now - np.timedelta64(48, "h"))
+    i_now = np.searchsorted(ts, now, side="right")
+    i_next24 = np.searchsorted(ts, now + np.timedelta64(24, "h"), side="right")
+
+    recent_total = float(np.nansum(precip_vals[i_recent:]))
+    next_day = float(np.nansum(precip_vals[i_now:i_next24]))
+    upcoming = precip_vals[i_now:]
+    peak_hour = (
+        float(np.nanmax(upcoming)) if upcoming.size and np.isfinite(upcoming).any() else 0.0
+    )
+
+    df = pd.DataFrame({"Timestamp": times, "Precipitation (mm)": precip_vals})
+    df["Local Timestamp"] = df["Timestamp"].dt.tz_localize("UTC")
+
+    return {
+        "scalars": {
+            "recent_total": round(recent_total, 1),
+            "next_day_total": round(next_day, 1),
+            "peak_hour": round(peak_hour, 2),
+        },
+        "dataframe": df,
+    }
+
+
+@st.cache_data(**_SUMMARY_CACHE)
+def summarize_hydrology(hydrology: dict) -> dict:
+    daily = hydrology.get("daily", {})
+    dates = pd.to_datetime(daily.get("time", []), utc=True, format="ISO8601")
+    if dates.empty:
+        raise ValueError("Flood API returned no discharge timeline")
+
+    discharge = _as_float32(daily.get("river_discharge", []))
+    discharge_min = _as_float32(daily.get("river_discharge_min", []))
+    discharge_max = _as_float32(daily.get("river_discharge_max", []))
+    discharge_mean = _as_float32(daily.get("river_discharge_mean", []))
+
+    current_discharge = float(discharge[0]) if discharge.size and np.isfinite(discharge[0]) else 0.0
+    head = discharge_max[:10]
+    top_forecast = float(np.nanmax(head)) if head.size and np.isfinite(head).any() else 0.0
+
+    trend_window = discharge_mean[:7]
+    trend_delta = 0.0
+    if trend_window.size >= 2 and np.isfinite(trend_window[[0, -1]]).all():
+        trend_delta = float(trend_window[-1] - trend_window[0])
+
+    df = pd.DataFrame(
+        {
+            "Date": dates,
+            "Discharge (m³/s)": discharge,
+            "Discharge min (m³/s)": discharge_min,
+            "Discharge max (m³/s)": discharge_max,
+            "Discharge mean (m³/s)": discharge_mean,
+        }
+    )
+
+    return {
+        "scalars": {
+            "current_discharge": round(current_discharge, 2),
+            "peak_discharge": round(top_forecast, 2),
+            "trend_delta": round(trend_delta, 2),
+        },
+        "dataframe": df,
+    }
+
+
+@st.cache_data(show_spinner=False)
+def build_waterlevel_recommendation(
+    forecast_summary: dict | None,
+    hydrology_summary: dict | None,
+    precip_summary: dict | None,
+) -> dict | None:
+    """Blend the three feed summaries into a suggested extra water level.
+
+    Takes only the scalar dicts — never the DataFrames — so the cache key
+    hashes a handful of floats instead of walking whole frames.
+    """
+    if not any([forecast_summary, hydrology_summary, precip_summary]):
+        return None
+
+    components = []
+    total = 0.0
+
+    if forecast_summary:
+        rain_factor = forecast_summary["total_rain"] / 180.0
+        wind_factor = forecast_summary["peak_wind"] / 200.0
+        total += rain_factor + wind_factor
+        components.append(
+            {
+                "label": "7-day rainfall",
+                "value": round(rain_factor, 2),
+                "context": f"{forecast_summary['total_rain']:.0f} mm total rain",
+            }
+        )
+        components.append(
+            {
+                "label": "Peak wind",
+                "value": round(wind_factor, 2),
+                "context": f"{forecast_summary['peak_wind']:.0f} km/h gusts",
+            }
+        )
+
+    if precip_summary:
+        near_term = precip_summary["next_day_total"] / 120.0
+        burst = np.clip(precip_summary["peak_hour"] / 30.0, 0.0, 1.2)
+        total += near_term + burst
+        components.append(
+            {
+                "label": "Next 24h rain",
+                "value": round(near_term, 2),
+                "context": f"{precip_summary['next_day_total']:.1f} mm expected",
+            }
+        )
+        components.append(
+            {
+                "label": "Peak hourly rain",
+                "value": round(burst, 2),
+                "context": f"{precip_summary['peak_hour']:.2f} mm/h burst",
+            }
+        )
+
+    if hydrology_summary:
+        discharge_growth = 0.0
+        if hydrology_summary["current_discharge"] > 0:
+            discharge_growth = (
+                hydrology_summary["peak_discharge"] - hydrology_summary["current_discharge"]
+            ) / max(hydrology_summary["current_discharge"], 1.0)
+        discharge_growth = np.clip(discharge_growth, -0.5, 4.0)
+        trend_factor = hydrology_summary["trend_delta"] / 10.0
+        total += discharge_growth + trend_factor
+        components.append(
+            {
+                "label": "Peak discharge vs today",
+                "value": round(discharge_growth, 2),
+                "context": (
+                    f"{hydrology_summary['current_discharge']:.1f}→{hydrology_summary['peak_discharge']:.1f} m³/s"
+                ),
+            }
+        )
+        components.append(
+            {
+                "label": "Weekly discharge trend",
+                "value": round(trend_factor, 2),
+                "context": f"Δ {hydrology_summary['trend_delta']:+.2f} m³/s over 1 week",
+            }
+        )
+
+    suggested = float(np.clip(total, 0.0, 6.0))
+    return {
+        "suggested_extra": round(suggested, 2),
+        "components": components,
+        "generated_at": datetime.utcnow(),
+    }
+
+
+def request_llm_guidance(
+    api_key: str,
+    model: str,
+    recommendation: dict | None,
+    forecast_summary: dict | None,
+    hydrology_summary: dict | None,
+    precip_summary: dict | None,
+    target_level: float,
+):
+    """Yield the LLM scenario note as it streams from the API.
+
+    A generator (fed to st.write_stream) shows the first tokens within
+    ~half a second instead of blocking until the full completion lands.
+    """
+    if not api_key:
+        raise ValueError("Provide an API key to request LLM guidance.")
+
+    bullet_lines = []
+    if recommendation:
+        for comp in recommendation.get("components", []):
+            bullet_lines.append(f"- {comp['label']}: +{comp['value']:.2f} m ({comp['context']})")
+
+    drivers_block = bullet_lines or ["- No quantitative drivers available."]
+    summary_lines = [
+        f"Target flood water surface: {target_level:.2f} m",
+        f"Recommended extra depth: {recommendation['suggested_extra']:.2f} m" if recommendation else "Recommendation pending.",
+        "Drivers:",
+        *drivers_block,
+    ]
+
+    extra_context = {
+        "forecast": forecast_summary or {},
+        "hydrology": hydrology_summary or {},
+        "precipitation": precip_summary or {},
+    }
+
+    summary_block = "\n".join(summary_lines)
+    prompt = textwrap.dedent(
+        f"""
+        You are advising rapid flood response teams for Sunamganj, Bangladesh.
+        Using the quantitative inputs below, draft a concise paragraph (<=120 words)
+        with actionable interpretation of the recommended flood stage increase and how
+        recent rainfall and discharge outlooks influence that choice. Always mention
+        notable risks if river discharge is surging or if extreme rain is imminent.
+
+        Summary:
+        {summary_block}
+
+        Raw metrics (JSON):
+        {json.dumps(extra_context, default=str)}
+        """
+    ).strip()
+
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": "You are a hydrologist supporting disaster responders."},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0.2,
+        "max_tokens": 280,
+        "stream": True,
+    }
+
+    response = _llm_session().post(
+        "https://api.openai.com/v1/chat/completions",
+        json=payload,
+        headers=headers,
+        timeout=45,
+        stream=True,
+    )
+    response.raise_for_status()
+    got_content = False
+    for line in response.iter_lines():
+        if not line.startswith(b"data: "):
+            continue
+        body = line[6:]
+        if body == b"[DONE]":
+            break
+        chunk = orjson.loads(body)
+        choices = chunk.get("choices")
+        if not choices:
+            continue
+        delta = choices[0].get("delta", {}).get("content", "")
+        if delta:
+            got_content = True
+            yield delta
+    if not got_content:
+        raise RuntimeError("LLM response did not include any content.")
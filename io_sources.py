@@ -0,0 +1,172 @@
+"""Remote sources for JolChobi: batched Overpass (OSM) and Open-Meteo feeds."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+import streamlit as st
+
+from forecast import (
+    create_retry_session,
+    fetch_hourly_precipitation,
+    fetch_hydrology_forecast,
+    fetch_weekly_forecast,
+)
+
+# One process-wide pooled session shared by every Streamlit session: urllib3
+# keeps the Overpass socket alive between calls. Built lazily under a lock so
+# concurrent first requests don't race the construction.
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _session():
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                _SESSION = create_retry_session(cache_name="overpass_cache")
+    return _SESSION
+
+
+_HEALTH_PATTERN = "hospital|clinic|doctors|pharmacy"
+
+
+def overpass(query: str, endpoint: str) -> dict:
+    r = _session().post(endpoint, data={"data": query}, timeout=90)
+    r.raise_for_status()
+    return r.json()
+
+
+def osm_all(endpoint: str, bbox) -> dict:
+    """Fetch roads, health amenities, and shelters in one Overpass request.
+
+    Overpass serializes concurrent queries per client and rate-limits bursts,
+    so one union document with two output blocks (geometry for ways, centers
+    for amenities) beats three round-trips; the tags tell us which layer each
+    element belongs to.
+    """
+    s, w, n, e = bbox
+    bb = f"({s},{w},{n},{e})"
+    q = f"""
+    [out:json][timeout:90];
+    way["highway"]{bb};
+    out geom;
+    (
+      node["amenity"~"{_HEALTH_PATTERN}"]{bb};
+      way["amenity"~"{_HEALTH_PATTERN}"]{bb};
+      relation["amenity"~"{_HEALTH_PATTERN}"]{bb};
+      node["amenity"="shelter"]{bb};
+      way["amenity"="shelter"]{bb};
+      relation["amenity"="shelter"]{bb};
+    );
+    out center;
+    """
+    return overpass(q, endpoint)
+
+
+def roads_from_elements(elements) -> gpd.GeoDataFrame:
+    # One Python pass packs the vertices into flat arrays; shapely 2's bulk
+    # linestrings() constructor then builds every geometry in C, skipping the
+    # per-way GeoJSON-dict/shape() detour.
+    names, highways, coords, way_ids = [], [], [], []
+    for el in elements:
+        tags = el.get("tags") or {}
+        if el.get("type") != "way" or "highway" not in tags:
+            continue
+        geometry = el.get("geometry", [])
+        if len(geometry) < 2:
+            continue
+        way = len(names)
+        names.append(tags.get("name", ""))
+        highways.append(tags.get("highway", "unknown"))
+        coords.extend((nd["lon"], nd["lat"]) for nd in geometry)
+        way_ids.extend([way] * len(geometry))
+
+    if not names:
+        return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+
+    geoms = shapely.linestrings(
+        np.asarray(coords, dtype="float64"), indices=np.asarray(way_ids, dtype=np.int64)
+    )
+    return gpd.GeoDataFrame({"name": names, "highway": highways}, geometry=geoms, crs="EPSG:4326")
+
+
+def points_from_elements(elements, what: str) -> gpd.GeoDataFrame:
+    # Same pattern as the roads: plain lists in the scan, one bulk points()
+    # call at the end. The cyclone keyword match runs as a single vectorized
+    # str.contains over all shelter candidates rather than per-element
+    # substring checks.
+    names, stypes, lons, lats = [], [], [], []
+    for el in elements:
+        tags = el.get("tags") or {}
+        amenity = tags.get("amenity", "")
+        if what == "health":
+            if amenity == "shelter" or not amenity:
+                continue
+        elif amenity != "shelter":
+            continue
+
+        if el["type"] == "node" and "lat" in el:
+            lon, lat = el["lon"], el["lat"]
+        else:
+            c = el.get("center")
+            if not c:
+                continue
+            lat, lon = c["lat"], c["lon"]
+        names.append(tags.get("name", ""))
+        stypes.append(tags.get("shelter_type", "") or "")
+        lons.append(lon)
+        lats.append(lat)
+
+    lons = np.asarray(lons, dtype="float64")
+    lats = np.asarray(lats, dtype="float64")
+    if what != "health" and names:
+        hit = (
+            pd.Series(names).str.contains("cyclone|storm", case=False, na=False)
+            | pd.Series(stypes).str.contains("cyclone|storm", case=False, na=False)
+        ).to_numpy()
+        names = [n for n, keep in zip(names, hit) if keep]
+        lons, lats = lons[hit], lats[hit]
+    names = [n or what for n in names]
+    return gpd.GeoDataFrame(
+        {"name": names, "lon": lons, "lat": lats},
+        geometry=shapely.points(lons, lats),
+        crs="EPSG:4326",
+    )
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_osm_layers(endpoint: str, bbox_key: tuple):
+    """Cached (roads, health, shelters) triple from a single Overpass call."""
+    elements = osm_all(endpoint, bbox_key).get("elements", [])
+    return (
+        roads_from_elements(elements),
+        points_from_elements(elements, "health"),
+        points_from_elements(elements, "cyclone_shelter"),
+    )
+
+
+def fetch_all_meteo(lat: float, lon: float):
+    """Fetch the three Open-Meteo feeds concurrently.
+
+    They are independent HTTPS calls sharing the pooled session, so the cold
+    path costs max(RTT) instead of sum(RTT); cached feeds return from
+    st.cache_data without reaching the executor's network calls. Returns
+    ({feed: payload}, {feed: error message}).
+    """
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        futures = {
+            "forecast": ex.submit(fetch_weekly_forecast, lat, lon),
+            "precip": ex.submit(fetch_hourly_precipitation, lat, lon),
+            "hydrology": ex.submit(fetch_hydrology_forecast, lat, lon),
+        }
+        feeds, errors = {}, {}
+        for feed, fut in futures.items():
+            try:
+                feeds[feed] = fut.result()
+            except Exception as exc:
+                errors[feed] = str(exc)
+    return feeds, errors
@@ -0,0 +1,163 @@
+"""Overlay rendering for JolChobi: DEM/flood RGBA buffers and map layers."""
+import base64
+import hashlib
+import io
+
+import folium
+import matplotlib
+import numpy as np
+import orjson
+import streamlit as st
+from PIL import Image
+
+matplotlib.use("Agg")
+from matplotlib import colors
+
+# Content-hash ndarrays instead of letting Streamlit pickle-walk them; eight
+# bytes of blake2b is plenty to key a raster.
+_NDARRAY_HASH = {np.ndarray: lambda a: hashlib.blake2b(a.tobytes(), digest_size=8).digest()}
+
+# Normalization scratch reused across reruns — the DEM shape only changes
+# when a new raster is loaded.
+_scratch_f32 = None
+
+
+@st.cache_data(show_spinner=False, hash_funcs=_NDARRAY_HASH)
+def create_dem_overlay(dem, dem_min: float | None = None, dem_max: float | None = None, finite=None) -> np.ndarray:
+    """Greyscale-plus-alpha RGBA for the elevation layer.
+
+    Cached on the DEM content hash: slider-driven reruns skip the
+    normalization and channel packing entirely, since the DEM only changes
+    when a new file is loaded. Pass precomputed extrema (see DEMStats) and a
+    uint8 finite mask to skip the nanmin/nanmax/isfinite scans too.
+    """
+    if dem_min is None:
+        dem_min = np.nanmin(dem)
+    if dem_max is None:
+        dem_max = np.nanmax(dem)
+    if finite is None:
+        finite = np.isfinite(dem).view(np.uint8)
+    global _scratch_f32
+    if _scratch_f32 is None or _scratch_f32.shape != dem.shape:
+        _scratch_f32 = np.empty(dem.shape, dtype=np.float32)
+    # Branchless normalize-to-uint8 through out= ops on a reused float32
+    # scratch buffer: fmax/fmin clamp and flush NaN to 0 in the same pass
+    # (fmax(NaN, 0) is 0), so there is no separate nan_to_num or where walk.
+    scale = 255.0 / (dem_max - dem_min + 1e-6)
+    np.subtract(dem, np.float32(dem_min), out=_scratch_f32)
+    np.multiply(_scratch_f32, np.float32(scale), out=_scratch_f32)
+    np.fmax(_scratch_f32, np.float32(0.0), out=_scratch_f32)
+    np.fmin(_scratch_f32, np.float32(255.0), out=_scratch_f32)
+    dem_img = _scratch_f32.astype(np.uint8)
+    # Write the greyscale band + alpha straight into one preallocated RGBA
+    # buffer instead of np.dstack, which copies the same channel three times.
+    dem_rgba = np.empty(dem_img.shape + (4,), dtype="uint8")
+    dem_rgba[..., 0] = dem_rgba[..., 1] = dem_rgba[..., 2] = dem_img
+    dem_rgba[..., 3] = finite * np.uint8(120)
+    return dem_rgba
+
+
+def _build_lut(stops) -> np.ndarray:
+    """Evaluate a LinearSegmentedColormap once into a 256×4 uint8 LUT."""
+    cmap = colors.LinearSegmentedColormap.from_list("lut", stops)
+    return (cmap(np.linspace(0.0, 1.0, 256)) * 255).astype(np.uint8)
+
+
+# Palettes precompiled at import: per-pixel colormap evaluation becomes a
+# uint8 gather, and no call ever re-instantiates a colormap.
+_PALETTES = {
+    "shallow_to_deep": _build_lut([
+        (0.0, "#e0f3f8"),  # very light blue
+        (0.25, "#abd9e9"),
+        (0.5, "#74add1"),
+        (0.75, "#4575b4"),
+        (1.0, "#313695"),  # deep indigo
+    ]),
+    "shallow_to_deep_red": _build_lut([
+        (0.0, "#fee090"),
+        (0.5, "#f46d43"),
+        (1.0, "#a50026"),
+    ]),
+}
+
+
+@st.cache_data(show_spinner=False, hash_funcs=_NDARRAY_HASH)
+def create_flood_overlay(flood, depth, palette: str = "shallow_to_deep"):
+    """Depth-shaded RGBA for the inundation overlay; returns (rgba, max_depth)."""
+    mask = flood != 0
+    max_depth = float(depth[mask].max()) if np.any(mask) else 0.0
+    palette_ceiling = max(max_depth, 1e-3)
+    # Explicit float32 scaling: colors.Normalize would hand back a float64
+    # masked array and double the bandwidth of the overlay math.
+    normalized_depth = np.clip(
+        depth.astype(np.float32, copy=False) * np.float32(1.0 / palette_ceiling),
+        np.float32(0.0), np.float32(1.0),
+    )
+
+    # Quantize depth to a 256-entry uint8 LUT gather instead of evaluating the
+    # colormap per pixel: cmap(array) would allocate a float64 H×W×4 buffer
+    # (~32 bytes/pixel) that the cast then throws away.
+    idx = (normalized_depth * np.float32(255.0)).astype(np.uint8)
+    rgba = _PALETTES[palette][idx]
+    alpha = (
+        np.clip(np.float32(0.25) + np.float32(0.6) * normalized_depth, 0.0, 1.0)
+        * np.float32(255.0)
+    ).astype(np.uint8)
+    rgba[..., 3] = np.where(mask, alpha, 0)
+    rgba[~mask, :3] = 0
+    return rgba, max_depth
+
+
+def encode_overlay(rgba, fmt: str = "png") -> bytes:
+    """Encode an RGBA overlay for the map.
+
+    PNG runs at compress_level=1 — Pillow's default level 6 dominates render
+    time on multi-megapixel overlays. Lossless WebP encodes several times
+    faster still and compresses the mostly-transparent flood layer tighter.
+    """
+    buf = io.BytesIO()
+    img = Image.fromarray(rgba, mode="RGBA")
+    if fmt == "webp":
+        img.save(buf, format="WEBP", lossless=True, quality=0, method=0)
+    else:
+        img.save(buf, format="PNG", compress_level=1, optimize=False)
+    return buf.getvalue()
+
+
+def overlay_data_uri(rgba, fmt: str = "png") -> str:
+    """Overlay as a data URI, for ImageOverlay without a file on disk."""
+    media = "image/webp" if fmt == "webp" else "image/png"
+    return f"data:{media};base64," + base64.b64encode(encode_overlay(rgba, fmt)).decode()
+
+
+def add_osm_layers(m, roads, health, shelters) -> None:
+    """Add the OSM context layers as one batched GeoJson object each.
+
+    A single GeoJson per layer emits one compact JSON payload and one DOM
+    node instead of N CircleMarker JS blocks, which is what keeps the
+    Streamlit HTML embed responsive on dense networks.
+    """
+    if not roads.empty:
+        # orjson serializes the feature collection several times faster than
+        # the stdlib encoder roads.to_json() routes through, and it knows
+        # NumPy scalars natively.
+        roads_geojson = orjson.dumps(
+            roads.__geo_interface__, option=orjson.OPT_SERIALIZE_NUMPY
+        ).decode()
+        folium.GeoJson(roads_geojson, name="Roads", style_function=lambda x: {"color":"#444","weight":1}).add_to(m)
+
+    if not health.empty:
+        folium.GeoJson(
+            health.__geo_interface__,
+            name="Health",
+            marker=folium.CircleMarker(radius=4, color="#2ca25f", fill=True, fill_opacity=0.9),
+            tooltip=folium.GeoJsonTooltip(fields=["name"], aliases=["Health:"]),
+        ).add_to(m)
+
+    if not shelters.empty:
+        folium.GeoJson(
+            shelters.__geo_interface__,
+            name="Cyclone Shelters",
+            marker=folium.CircleMarker(radius=4, color="#de2d26", fill=True, fill_opacity=0.9),
+            tooltip=folium.GeoJsonTooltip(fields=["name"], aliases=["Cyclone Shelter:"]),
+        ).add_to(m)
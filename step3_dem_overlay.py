@@ -3,6 +3,7 @@ import folium
 from folium.raster_layers import ImageOverlay
 import numpy as np
 import rasterio
+from rasterio.enums import Resampling
 from rasterio.warp import transform_bounds
 
 st.set_page_config(page_title="JolChobi Step 3", layout="wide")
@@ -11,8 +12,16 @@ st.title("JolChobi • Step 3: DEM Overlay")
 dem_path = st.text_input("DEM path (GeoTIFF)", "data/dem_sunamganj.tif")
 
 with rasterio.open(dem_path) as src:
-    dem = src.read(1).astype("float32")
-    dem = np.where(dem<-1000, np.nan, dem)
+    # Decimated read: the Folium view uses ~1024 px, so let GDAL pull the
+    # matching overview instead of the full raster and downsampling here.
+    _decim = max(1, max(src.width, src.height) // 1024)
+    dem = np.ascontiguousarray(src.read(
+        1,
+        out_shape=(src.height // _decim, src.width // _decim),
+        resampling=Resampling.bilinear,
+        out_dtype="float32",
+    ))
+    dem[dem < -1000] = np.nan
     bounds = src.bounds
     crs = src.crs
 
@@ -29,15 +38,9 @@ except Exception:
 center_lat, center_lon = (s+n)/2, (w+e)/2
 m = folium.Map(location=[center_lat, center_lon], zoom_start=9, control_scale=True)
 
-# build grayscale overlay
-dem_norm = (dem - np.nanmin(dem)) / (np.nanmax(dem)-np.nanmin(dem)+1e-6)
-dem_img = (np.nan_to_num(dem_norm)*255).astype("uint8")
-rgba = np.dstack([dem_img, dem_img, dem_img, np.where(np.isfinite(dem), 120, 0).astype("uint8")])
-
-from PIL import Image
-tmp = "dem_overlay_step3.png"
-Image.fromarray(rgba, mode="RGBA").save(tmp)
-
-ImageOverlay(name="Elevation (DEM)", image=tmp, bounds=[[s,w],[n,e]], opacity=0.5).add_to(m)
+# build grayscale overlay — encoded in memory as a data URI, no PNG on disk
+from render import create_dem_overlay, overlay_data_uri
+rgba = create_dem_overlay(dem)
+ImageOverlay(name="Elevation (DEM)", image=overlay_data_uri(rgba), bounds=[[s,w],[n,e]], opacity=0.5).add_to(m)
 st.components.v1.html(m._repr_html_(), height=650)
 st.success("DEM overlay added. You should see a gray hillshade-like layer.")
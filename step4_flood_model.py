@@ -3,6 +3,7 @@ import folium
 from folium.raster_layers import ImageOverlay
 import numpy as np
 import rasterio
+from rasterio.enums import Resampling
 
 st.set_page_config(page_title="JolChobi Step 4", layout="wide")
 st.title("JolChobi • Step 4: Simple Flood (Bathtub)")
@@ -11,11 +12,21 @@ dem_path = st.text_input("DEM path (GeoTIFF)", "data/dem_sunamganj.tif")
 water_level_m = st.slider("Water level above river (m)", 0.0, 6.0, 1.0, 0.1)
 
 with rasterio.open(dem_path) as src:
-    dem = src.read(1).astype("float32")
-    dem = np.where(dem<-1000, np.nan, dem)
+    # Decimated read: the Folium view uses ~1024 px, so let GDAL pull the
+    # matching overview instead of the full raster and downsampling here.
+    _decim = max(1, max(src.width, src.height) // 1024)
+    dem = np.ascontiguousarray(src.read(
+        1,
+        out_shape=(src.height // _decim, src.width // _decim),
+        resampling=Resampling.bilinear,
+        out_dtype="float32",
+    ))
+    dem[dem < -1000] = np.nan
     bounds = src.bounds
     crs = src.crs
-    transform = src.transform
+    transform = src.transform * src.transform.scale(
+        src.width / dem.shape[1], src.height / dem.shape[0]
+    )
 
 # reference "river level" using low percentile
 river_elev = np.nanpercentile(dem, 15)
@@ -35,18 +46,14 @@ except Exception:
 m = folium.Map(location=[(s+n)/2, (w+e)/2], zoom_start=9, control_scale=True)
 
 # DEM
-dem_norm = (dem - np.nanmin(dem)) / (np.nanmax(dem)-np.nanmin(dem)+1e-6)
-dem_img = (np.nan_to_num(dem_norm)*255).astype("uint8")
-rgba_dem = np.dstack([dem_img, dem_img, dem_img, np.where(np.isfinite(dem), 120, 0).astype("uint8")])
-from PIL import Image
-Image.fromarray(rgba_dem, mode="RGBA").save("dem_overlay_step4.png")
-ImageOverlay(name="Elevation (DEM)", image="dem_overlay_step4.png", bounds=[[s,w],[n,e]], opacity=0.5).add_to(m)
+from render import create_dem_overlay, overlay_data_uri
+rgba_dem = create_dem_overlay(dem)
+ImageOverlay(name="Elevation (DEM)", image=overlay_data_uri(rgba_dem), bounds=[[s,w],[n,e]], opacity=0.5).add_to(m)
 
 # Flood (blue)
 rgba_flood = np.zeros((flood.shape[0], flood.shape[1], 4), dtype="uint8")
 rgba_flood[flood==1] = np.array([43,131,186,160], dtype="uint8")
-Image.fromarray(rgba_flood, mode="RGBA").save("flood_overlay_step4.png")
-ImageOverlay(name="Inundation", image="flood_overlay_step4.png", bounds=[[s,w],[n,e]], opacity=0.8).add_to(m)
+ImageOverlay(name="Inundation", image=overlay_data_uri(rgba_flood), bounds=[[s,w],[n,e]], opacity=0.8).add_to(m)
 
 st.components.v1.html(m._repr_html_(), height=680)
 
@@ -1,8 +1,10 @@
 import streamlit as st
 import folium, requests, json
+import pandas as pd
 from folium.raster_layers import ImageOverlay
 import numpy as np
 import rasterio, math
+from rasterio.enums import Resampling
 
 st.set_page_config(page_title="JolChobi Step 5", layout="wide")
 st.title("JolChobi • Step 5: Live OSM Layers (roads, health, cyclone shelters)")
@@ -17,11 +19,21 @@ def overpass(query, endpoint):
     return r.json()
 
 with rasterio.open(dem_path) as src:
-    dem = src.read(1).astype("float32")
-    dem = np.where(dem<-1000, np.nan, dem)
+    # Decimated read: the Folium view uses ~1024 px, so let GDAL pull the
+    # matching overview instead of the full raster and downsampling here.
+    _decim = max(1, max(src.width, src.height) // 1024)
+    dem = np.ascontiguousarray(src.read(
+        1,
+        out_shape=(src.height // _decim, src.width // _decim),
+        resampling=Resampling.bilinear,
+        out_dtype="float32",
+    ))
+    dem[dem < -1000] = np.nan
     bounds = src.bounds
     crs = src.crs
-    transform = src.transform
+    transform = src.transform * src.transform.scale(
+        src.width / dem.shape[1], src.height / dem.shape[0]
+    )
 
 # map bounds
 try:
@@ -76,18 +88,14 @@ js_shelter = overpass(q_shelter, overpass_endpoint)
 m = folium.Map(location=[(s+n)/2, (w+e)/2], zoom_start=9, control_scale=True)
 
 # DEM overlay
-dem_norm = (dem - np.nanmin(dem)) / (np.nanmax(dem)-np.nanmin(dem)+1e-6)
-dem_img = (np.nan_to_num(dem_norm)*255).astype("uint8")
-from PIL import Image
-rgba_dem = np.dstack([dem_img, dem_img, dem_img, np.where(np.isfinite(dem), 120, 0).astype("uint8")])
-Image.fromarray(rgba_dem, mode="RGBA").save("dem_overlay_step5.png")
-ImageOverlay(name="Elevation (DEM)", image="dem_overlay_step5.png", bounds=[[s,w],[n,e]], opacity=0.5).add_to(m)
+from render import create_dem_overlay, overlay_data_uri
+rgba_dem = create_dem_overlay(dem)
+ImageOverlay(name="Elevation (DEM)", image=overlay_data_uri(rgba_dem), bounds=[[s,w],[n,e]], opacity=0.5).add_to(m)
 
 # Flood overlay
 rgba_flood = np.zeros((flood.shape[0], flood.shape[1], 4), dtype="uint8")
 rgba_flood[flood==1] = np.array([43,131,186,160], dtype="uint8")
-Image.fromarray(rgba_flood, mode="RGBA").save("flood_overlay_step5.png")
-ImageOverlay(name="Inundation", image="flood_overlay_step5.png", bounds=[[s,w],[n,e]], opacity=0.8).add_to(m)
+ImageOverlay(name="Inundation", image=overlay_data_uri(rgba_flood), bounds=[[s,w],[n,e]], opacity=0.8).add_to(m)
 
 # Roads layer
 import shapely.geometry as sg, geopandas as gpd
@@ -116,49 +124,68 @@ def add_points(js, label, color):
         folium.CircleMarker(location=[lat, lon], radius=4, color=color, fill=True, fill_opacity=0.9, popup=f"{label}: {name}").add_to(m)
 
 add_points(js_health, "Health", "#2ca25f")
-# Filter cyclone shelters by name/tag hint
-filtered = {"elements": []}
-for el in js_shelter.get("elements", []):
-    tags = el.get("tags", {})
-    name = (tags.get("name","") or "").lower()
-    stype = (tags.get("shelter_type","") or "").lower()
-    if "cyclone" in name or "storm" in name or "cyclone" in stype or "storm" in stype:
-        filtered["elements"].append(el)
+# Filter cyclone shelters by name/tag hint — one vectorized str.contains
+# over all candidates instead of a per-element .lower()/substring loop
+shelter_elems = js_shelter.get("elements", [])
+tag_df = pd.DataFrame({
+    "name": [(el.get("tags") or {}).get("name", "") or "" for el in shelter_elems],
+    "stype": [(el.get("tags") or {}).get("shelter_type", "") or "" for el in shelter_elems],
+})
+hit = (tag_df["name"].str.contains("cyclone|storm", case=False, na=False)
+       | tag_df["stype"].str.contains("cyclone|storm", case=False, na=False))
+filtered = {"elements": [el for el, keep in zip(shelter_elems, hit.to_numpy()) if keep]}
 add_points(filtered, "Cyclone Shelter", "#de2d26")
 
 folium.LayerControl(collapsed=False).add_to(m)
 st.components.v1.html(m._repr_html_(), height=700)
 st.success("Live OSM layers added. Try zooming and clicking points.")
 
-# Impact (simple point-in-flood sampling)
+# Impact (vectorized point-in-flood sampling)
 from pyproj import Transformer
 Tinv = Transformer.from_crs("EPSG:4326", crs, always_xy=True)
-def sample_mask(mask, lon, lat, transform):
-    x, y = Tinv.transform(lon, lat)
-    col = int((x - transform.c)/transform.a)
-    row = int((y - transform.f)/transform.e)
-    if 0 <= row < mask.shape[0] and 0 <= col < mask.shape[1]:
-        return mask[row, col]
-    return 0
-
-health_in = 0
-for el in filtered.get("elements", []): pass
-for el in js_health.get("elements", []):
-    if el["type"]=="node": lat, lon = el["lat"], el["lon"]
-    else:
-        c = el.get("center")
-        if not c: continue
-        lat, lon = c["lat"], c["lon"]
-    health_in += int(sample_mask(flood, lon, lat, transform)>0)
-
-shelter_in = 0
-for el in filtered.get("elements", []):
-    if el["type"]=="node": lat, lon = el["lat"], el["lon"]
-    else:
-        c = el.get("center")
-        if not c: continue
-        lat, lon = c["lat"], c["lon"]
-    shelter_in += int(sample_mask(flood, lon, lat, transform)>0)
+
+def element_lonlats(js):
+    lons, lats = [], []
+    for el in js.get("elements", []):
+        if el["type"]=="node":
+            lat, lon = el["lat"], el["lon"]
+        else:
+            c = el.get("center")
+            if not c: continue
+            lat, lon = c["lat"], c["lon"]
+        lons.append(lon); lats.append(lat)
+    return np.asarray(lons, dtype="float64"), np.asarray(lats, dtype="float64")
+
+try:
+    from numba import njit, prange
+
+    @njit(cache=True, parallel=True)
+    def count_hits(rows, cols, mask):
+        # Fused bounds check + gather: no boolean temporaries between the
+        # index arrays and the count.
+        c = 0
+        for k in prange(rows.shape[0]):
+            r, col = rows[k], cols[k]
+            if 0 <= r < mask.shape[0] and 0 <= col < mask.shape[1]:
+                c += 1 if mask[r, col] > 0 else 0
+        return c
+except Exception:
+    def count_hits(rows, cols, mask):
+        valid = (rows>=0)&(rows<mask.shape[0])&(cols>=0)&(cols<mask.shape[1])
+        return int((mask[rows[valid], cols[valid]]>0).sum())
+
+def sample_mask_vec(mask, lons, lats, transform):
+    # One batched pyproj transform + NumPy index math instead of a Python
+    # loop with per-point transform calls.
+    if lons.size == 0:
+        return 0
+    xs, ys = Tinv.transform(lons, lats)
+    cols = ((np.asarray(xs) - transform.c)/transform.a).astype(np.intp)
+    rows = ((np.asarray(ys) - transform.f)/transform.e).astype(np.intp)
+    return count_hits(rows, cols, mask)
+
+health_in = sample_mask_vec(flood, *element_lonlats(js_health), transform)
+shelter_in = sample_mask_vec(flood, *element_lonlats(filtered), transform)
 
 # area calc
 def pixel_area_km2(transform, crs, lat_mid):
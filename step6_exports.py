@@ -1,8 +1,15 @@
 import streamlit as st
-import folium, requests, json, numpy as np, rasterio, math
+import base64, io, os
+from concurrent.futures import ThreadPoolExecutor
+import folium, numpy as np, rasterio
 from folium.raster_layers import ImageOverlay
 from PIL import Image
 
+try:
+    import cv2
+except Exception:
+    cv2 = None
+
 st.set_page_config(page_title="JolChobi Step 6", layout="wide")
 st.title("JolChobi • Step 6: Exports + Final Polish")
 
@@ -10,54 +17,148 @@ dem_path = st.text_input("DEM path (GeoTIFF)", "data/dem_sunamganj.tif")
 water_level_m = st.slider("Water level above river (m)", 0.0, 6.0, 1.2, 0.1)
 export = st.button("Export GeoTIFF + PNG")
 
-with rasterio.open(dem_path) as src:
-    dem = src.read(1).astype("float32")
-    dem = np.where(dem<-1000, np.nan, dem)
-    bounds = src.bounds
-    crs = src.crs
-    transform = src.transform
+def overlay_uri(img_array, mode="RGBA"):
+    """Encode an overlay as an in-memory PNG data URI — no disk round-trip
+    per rerun; compress_level=1 keeps the encode off the hot path."""
+    if cv2 is not None and mode == "RGBA":
+        # OpenCV's libpng path runs SIMD filter selection and a faster zlib
+        # than Pillow's encoder; worth taking when the import is available.
+        ok, png = cv2.imencode(
+            ".png",
+            cv2.cvtColor(img_array, cv2.COLOR_RGBA2BGRA),
+            [cv2.IMWRITE_PNG_COMPRESSION, 1],
+        )
+        if ok:
+            return "data:image/png;base64," + base64.b64encode(png.tobytes()).decode()
+    buf = io.BytesIO()
+    Image.fromarray(img_array, mode=mode).save(buf, "PNG", optimize=False, compress_level=1)
+    return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
 
-# bounds in WGS84
-try:
-    from pyproj import Transformer
-    T = Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
-    w, s = T.transform(bounds.left, bounds.bottom)
-    e, n = T.transform(bounds.right, bounds.top)
-except Exception:
-    from rasterio.warp import transform_bounds as tb
-    w, s, e, n = tb(crs, "EPSG:4326", *bounds)
 
-river_elev = np.nanpercentile(dem, 15)
+@st.cache_data(show_spinner=False)
+def load_dem(path, mtime):
+    """DEM plus everything derived from it alone, cached on (path, mtime).
+
+    Slider reruns only pay for the flood mask and its overlay; the raster
+    read, WGS84 bounds, and the DEM overlay URI come from the cache.
+    """
+    with rasterio.open(path) as src:
+        dem = np.ascontiguousarray(src.read(1, out_dtype="float32"))
+        # One comparison catches the sentinel and native NaN alike (NaN >= x
+        # is False) and doubles as the finite mask for the overlay alpha.
+        valid = dem >= -1000
+        dem[~valid] = np.nan
+        bounds = src.bounds
+        crs = src.crs
+        transform = src.transform
+        # Export path reuses this profile; re-opening the raster just to
+        # copy metadata costs another header parse on large files.
+        prof = src.profile.copy()
+
+    # bounds in WGS84 — the transformer comes from the process-wide cache,
+    # so PROJ database/grid init happens once per CRS, not per load
+    try:
+        from exposure import get_transformer
+        T = get_transformer(crs.to_wkt(), "EPSG:4326")
+        # One vectorized call for both corners instead of two scalar
+        # Python-to-PROJ crossings.
+        xs, ys = T.transform([bounds.left, bounds.right], [bounds.bottom, bounds.top])
+        (w, e), (s, n) = xs, ys
+    except Exception:
+        from rasterio.warp import transform_bounds as tb
+        w, s, e, n = tb(crs, "EPSG:4326", *bounds)
+
+    # 15th percentile via a 4096-bin histogram over the finite values: O(N),
+    # no sort, no NaN-stripping copy — and cached here, off the rerun path.
+    finite_vals = dem[valid]
+    # Plain min/max over the NaN-free contiguous view: the values serve both
+    # the histogram range and the overlay normalization, replacing two
+    # NaN-aware full-raster reductions.
+    lo, hi = float(finite_vals.min()), float(finite_vals.max())
+    hist, edges = np.histogram(finite_vals, bins=4096, range=(lo, hi))
+    cdf = np.cumsum(hist)
+    river_elev = float(edges[np.searchsorted(cdf, 0.15 * cdf[-1])])
+
+    finite = valid.view(np.uint8)
+    scale = np.float32(255.0 / (hi - lo + 1e-6))
+    # Fused normalize-to-uint8: subtract/multiply/clamp run through out= on
+    # one scratch buffer, and fmax flushes NaN to 0 — no dem_norm/nan_to_num
+    # temporaries, one pass instead of five.
+    scratch = np.subtract(dem, np.float32(lo))
+    np.multiply(scratch, scale, out=scratch)
+    np.fmax(scratch, np.float32(0.0), out=scratch)
+    np.fmin(scratch, np.float32(255.0), out=scratch)
+    dem_img = scratch.astype(np.uint8)
+    # Two-channel grey+alpha image: the three RGB channels were identical,
+    # so LA mode halves the bytes Pillow filters/deflates and the data URI.
+    la_dem = np.stack([dem_img, finite * np.uint8(120)], axis=-1)
+    return dem, valid, bounds, crs, transform, prof, river_elev, overlay_uri(la_dem, mode="LA"), (w, s, e, n)
+
+
+dem, valid, bounds, crs, transform, prof, river_elev, dem_uri, (w, s, e, n) = load_dem(
+    dem_path, os.path.getmtime(dem_path)
+)
+
 target = river_elev + water_level_m
-flood = (dem <= target).astype("uint8")
+# less_equal writes straight into a preallocated bool buffer (NaN compares
+# False, as desired); the uint8 view reinterprets the same bytes, so the
+# .astype copy disappears.
+flood_bool = np.empty(dem.shape, dtype=bool)
+np.less_equal(dem, target, out=flood_bool)
+flood = flood_bool.view(np.uint8)
 
 m = folium.Map(location=[(s+n)/2, (w+e)/2], zoom_start=9, control_scale=True)
-dem_norm = (dem - np.nanmin(dem)) / (np.nanmax(dem)-np.nanmin(dem)+1e-6)
-dem_img = (np.nan_to_num(dem_norm)*255).astype("uint8")
-rgba_dem = np.dstack([dem_img, dem_img, dem_img, np.where(np.isfinite(dem), 120, 0).astype("uint8")])
-Image.fromarray(rgba_dem, mode="RGBA").save("dem_overlay_step6.png")
-ImageOverlay(name="Elevation (DEM)", image="dem_overlay_step6.png", bounds=[[s,w],[n,e]], opacity=0.5).add_to(m)
+ImageOverlay(name="Elevation (DEM)", image=dem_uri, bounds=[[s,w],[n,e]], opacity=0.5).add_to(m)
 
-rgba_flood = np.zeros((flood.shape[0], flood.shape[1], 4), dtype="uint8")
-rgba_flood[flood==1] = np.array([43,131,186,160], dtype="uint8")
-Image.fromarray(rgba_flood, mode="RGBA").save("flood_overlay_step6.png")
-ImageOverlay(name="Inundation", image="flood_overlay_step6.png", bounds=[[s,w],[n,e]], opacity=0.8).add_to(m)
+flood_mask = flood_bool
+any_flood = bool(flood_mask.any())
+if any_flood:
+    rgba_flood = np.zeros((flood.shape[0], flood.shape[1], 4), dtype="uint8")
+    # Per-channel masked stores: four contiguous scalar fills instead of
+    # broadcasting a (4,) palette row through advanced indexing into the 3-D
+    # array per flooded pixel.
+    rgba_flood[..., 0][flood_mask] = 43
+    rgba_flood[..., 1][flood_mask] = 131
+    rgba_flood[..., 2][flood_mask] = 186
+    rgba_flood[..., 3][flood_mask] = 160
+    ImageOverlay(name="Inundation", image=overlay_uri(rgba_flood), bounds=[[s,w],[n,e]], opacity=0.8).add_to(m)
 
 st.components.v1.html(m._repr_html_(), height=680)
 
 if export:
     # GeoTIFF export
-    with rasterio.open(dem_path) as src:
-        prof = src.profile
-    prof.update(dtype=rasterio.uint8, count=1, nodata=0, compress="lzw")
+    # packbits encodes a 2-class mask far faster than LZW and compresses it
+    # nearly as small; 512-px tiles let the writer pipeline block encodes.
+    prof.update(
+        dtype=rasterio.uint8, count=1, nodata=0,
+        compress="packbits", tiled=True, blockxsize=512, blockysize=512,
+    )
     out_tif = "jolchobi_flood_sunamganj.tif"
-    with rasterio.open(out_tif, "w", **prof) as dst:
-        dst.write(flood.astype("uint8"), 1)
-
-    # PNG export
     out_png = "jolchobi_map.png"
-    Image.fromarray(rgba_flood, mode="RGBA").save(out_png)
+
+    def _write_tif():
+        # NUM_THREADS has GDAL compress the 512-px tiles on all cores behind
+        # a single handle — same block-parallel encode a per-window thread
+        # pool would give, without sharing a dataset handle across Python
+        # threads (GDAL writes are not thread-safe per handle).
+        with rasterio.open(out_tif, "w", num_threads="ALL_CPUS", **prof) as dst:
+            dst.write(flood, 1)
+
+    def _write_png():
+        Image.fromarray(rgba_flood, mode="RGBA").save(out_png, compress_level=1)
+
+    # GDAL and Pillow both release the GIL while encoding, so the two
+    # independent outputs compress concurrently instead of back to back.
+    # A dry scenario still writes the (empty) GeoTIFF for downstream tools
+    # but skips the all-transparent PNG.
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        jobs = [ex.submit(_write_tif)]
+        if any_flood:
+            jobs.append(ex.submit(_write_png))
+        for fut in jobs:
+            fut.result()
 
     st.success("Exports saved.")
     st.markdown(f"- **GeoTIFF**: `{out_tif}`")
-    st.markdown(f"- **PNG**: `{out_png}`")
+    if any_flood:
+        st.markdown(f"- **PNG**: `{out_png}`")
@@ -0,0 +1,123 @@
+"""Tests for raster-space exposure counting."""
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+from affine import Affine
+from pyproj import CRS
+
+from exposure import (
+    calculate_flooded_roads_km,
+    calculate_point_exposure,
+    flooded_roads_km_by_type,
+    get_transformer,
+)
+
+# Module-scoped fixtures: the CRS parses and the mask allocation happen once
+# for the whole module instead of per test.
+
+
+@pytest.fixture(scope="module")
+def utm_crs():
+    return CRS.from_epsg(32645)
+
+
+@pytest.fixture(scope="module")
+def affine_100m():
+    # 5x5 grid of 100 m pixels with its top-left corner at (500000, 2700000).
+    return Affine(100.0, 0.0, 500000.0, 0.0, -100.0, 2700000.0)
+
+
+@pytest.fixture(scope="module")
+def small_flood_mask():
+    # Top two rows flooded, bottom three dry.
+    mask = np.zeros((5, 5), dtype=np.uint8)
+    mask[:2, :] = 1
+    return mask
+
+
+@pytest.fixture(scope="module")
+def to_wgs(utm_crs):
+    return get_transformer(utm_crs.to_wkt(), "EPSG:4326")
+
+
+@pytest.fixture(scope="module")
+def to_utm(utm_crs):
+    return get_transformer("EPSG:4326", utm_crs.to_wkt())
+
+
+def _points_gdf(utm_xys, to_wgs):
+    xs = [x for x, _ in utm_xys]
+    ys = [y for _, y in utm_xys]
+    lons, lats = to_wgs.transform(xs, ys)
+    return gpd.GeoDataFrame(
+        {"name": [f"p{i}" for i in range(len(utm_xys))], "lon": lons, "lat": lats},
+        geometry=shapely.points(lons, lats),
+        crs="EPSG:4326",
+    )
+
+
+class TestPointExposure:
+    def test_counts_points_on_flooded_pixels(self, small_flood_mask, affine_100m, to_wgs, to_utm):
+        points = _points_gdf(
+            [
+                (500050.0, 2699950.0),  # row 0 — flooded
+                (500250.0, 2699850.0),  # row 1 — flooded
+                (500050.0, 2699550.0),  # row 4 — dry
+            ],
+            to_wgs,
+        )
+        assert calculate_point_exposure(points, small_flood_mask, affine_100m, to_utm) == 2
+
+    def test_empty_points(self, small_flood_mask, affine_100m, to_utm):
+        empty = gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+        assert calculate_point_exposure(empty, small_flood_mask, affine_100m, to_utm) == 0
+
+    def test_out_of_grid_points_ignored(self, small_flood_mask, affine_100m, to_wgs, to_utm):
+        points = _points_gdf([(499000.0, 2699950.0)], to_wgs)
+        assert calculate_point_exposure(points, small_flood_mask, affine_100m, to_utm) == 0
+
+
+def _roads_gdf(segments, highways, to_wgs):
+    geoms = []
+    for seg in segments:
+        xs = [x for x, _ in seg]
+        ys = [y for _, y in seg]
+        lons, lats = to_wgs.transform(xs, ys)
+        geoms.append(shapely.linestrings(list(zip(lons, lats))))
+    return gpd.GeoDataFrame({"highway": highways}, geometry=geoms, crs="EPSG:4326")
+
+
+class TestFloodedRoads:
+    def test_fully_flooded_road_length(self, small_flood_mask, affine_100m, utm_crs, to_wgs):
+        # 400 m across row 0, which is entirely flooded.
+        roads = _roads_gdf(
+            [[(500050.0, 2699950.0), (500450.0, 2699950.0)]], ["primary"], to_wgs
+        )
+        km = calculate_flooded_roads_km(roads, small_flood_mask, affine_100m, utm_crs)
+        assert km == pytest.approx(0.4, abs=0.1)
+
+    def test_dry_road_contributes_nothing(self, small_flood_mask, affine_100m, utm_crs, to_wgs):
+        roads = _roads_gdf(
+            [[(500050.0, 2699550.0), (500450.0, 2699550.0)]], ["residential"], to_wgs
+        )
+        km = calculate_flooded_roads_km(roads, small_flood_mask, affine_100m, utm_crs)
+        assert km == pytest.approx(0.0, abs=1e-6)
+
+    def test_breakdown_by_highway_class(self, small_flood_mask, affine_100m, utm_crs, to_wgs):
+        roads = _roads_gdf(
+            [
+                [(500050.0, 2699950.0), (500450.0, 2699950.0)],  # flooded
+                [(500050.0, 2699550.0), (500450.0, 2699550.0)],  # dry
+            ],
+            ["primary", "residential"],
+            to_wgs,
+        )
+        by_type = flooded_roads_km_by_type(roads, small_flood_mask, affine_100m, utm_crs)
+        assert set(by_type) == {"primary"}
+        assert by_type["primary"] == pytest.approx(0.4, abs=0.1)
+
+    def test_empty_roads(self, small_flood_mask, affine_100m, utm_crs):
+        empty = gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+        assert calculate_flooded_roads_km(empty, small_flood_mask, affine_100m, utm_crs) == 0.0
+        assert flooded_roads_km_by_type(empty, small_flood_mask, affine_100m, utm_crs) == {}
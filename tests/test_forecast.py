@@ -0,0 +1,35 @@
+"""Tests for the forecast feed summarizers."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from forecast import summarize_precip
+
+
+class TestPrecipSummary:
+    def _hourly_payload(self, hours_back=48, periods=120):
+        # Vectorized ISO timestamp generation: the datetime64[m] cast formats
+        # in C, instead of a per-element strftime loop.
+        start = pd.Timestamp.utcnow().tz_localize(None).floor("h") - pd.Timedelta(hours=hours_back)
+        times = pd.date_range(start, periods=periods, freq="h")
+        return {
+            "hourly": {
+                "time": times.values.astype("datetime64[m]").astype(str).tolist(),
+                "precipitation": np.ones(periods).tolist(),
+            }
+        }
+
+    def test_precip_summary(self):
+        summary = summarize_precip(self._hourly_payload())
+        scalars = summary["scalars"]
+        # 1 mm/h on an hourly grid: exactly 24 entries fall in the next-24h
+        # window, and the whole series sits inside the trailing-48h window
+        # give or take the sub-hour offset of "now".
+        assert scalars["next_day_total"] == 24.0
+        assert scalars["peak_hour"] == 1.0
+        assert scalars["recent_total"] >= 119.0
+        assert len(summary["dataframe"]) == 120
+
+    def test_empty_feed_raises(self):
+        with pytest.raises(ValueError):
+            summarize_precip({"hourly": {"time": [], "precipitation": []}})
@@ -0,0 +1,72 @@
+"""Tests for the flood model core."""
+import numpy as np
+import pytest
+from affine import Affine
+
+from model import (
+    compute_dem_stats,
+    compute_flood,
+    estimate_river_base_elevation,
+    quick_hand,
+)
+
+
+@pytest.fixture(scope="module")
+def affine_100m():
+    return Affine(100.0, 0.0, 500000.0, 0.0, -100.0, 2700000.0)
+
+
+@pytest.fixture(scope="module")
+def dem():
+    # Deterministic 40x40 surface sloping away from a low western edge, with
+    # one NaN hole.
+    surface = np.add.outer(np.zeros(40), np.linspace(0.0, 20.0, 40)).astype("float32")
+    surface[3, 3] = np.nan
+    surface.flags.writeable = False
+    return surface
+
+
+class TestDemStats:
+    def test_matches_nan_aware_reductions(self, dem):
+        stats = compute_dem_stats(dem)
+        assert stats.min == pytest.approx(float(np.nanmin(dem)))
+        assert stats.max == pytest.approx(float(np.nanmax(dem)))
+        assert stats.p5 == pytest.approx(float(np.nanpercentile(dem, 5)), rel=1e-6)
+        assert stats.p15 == pytest.approx(float(np.nanpercentile(dem, 15)), rel=1e-6)
+
+    def test_river_elevation_uses_lowest_cells(self, dem):
+        stats = compute_dem_stats(dem)
+        expected = float(np.nanmean(dem[dem <= np.nanpercentile(dem, 5)]))
+        assert estimate_river_base_elevation(dem, stats) == pytest.approx(expected)
+        assert estimate_river_base_elevation(dem) == pytest.approx(expected)
+
+
+class TestComputeFlood:
+    def test_bathtub_mask_and_depth(self, dem, affine_100m):
+        target = 5.0
+        flood, depth = compute_flood(dem, affine_100m, "Bathtub (DEM ≤ level)", target, 1.0)
+        expected_mask = (dem <= target)
+        assert (flood.astype(bool) == expected_mask).all()
+        assert depth[expected_mask] == pytest.approx((target - dem[expected_mask]), abs=1e-5)
+        # NaN cells never flood and carry zero depth.
+        assert flood[3, 3] == 0
+        assert depth[3, 3] == 0.0
+
+    def test_hand_floods_near_the_low_network(self, dem, affine_100m):
+        stats = compute_dem_stats(dem)
+        flood, depth = compute_flood(dem, affine_100m, "HAND (approx)", 5.0, 150.0, stats)
+        # The low network is the western edge; a 150 m reach floods it and
+        # its immediate neighbours but not the far side of the grid.
+        assert flood[:, 0].all()
+        assert not flood[:, -1].any()
+        assert (depth >= 0).all()
+
+
+class TestQuickHand:
+    def test_distances_scale_with_pixel_size(self, dem, affine_100m):
+        hand = quick_hand(dem, affine_100m)
+        low = dem <= np.nanpercentile(dem, 10)
+        assert (hand[low] == 0).all()
+        # First column right of the low network sits one 100 m pixel away.
+        first_dry_col = int(np.argmax(~low[0]))
+        assert hand[0, first_dry_col] == pytest.approx(100.0)